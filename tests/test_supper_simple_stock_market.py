@@ -1,20 +1,18 @@
 from unittest import mock
 
-import pandas as pd
 import pytest
 
-from trading.supper_simple_stock_market import Stock, Trade, StockMarket, GlobalBeverageCorporationExchange, datetime, \
-    timedelta
+from trading.supper_simple_stock_market import Stock, Trade, StockMarket, GlobalBeverageCorporationExchange, \
+    _TradeBook, _to_ns, datetime, timedelta
 
 
 @pytest.fixture(scope='module')
 def stock_data():
-    return pd.DataFrame.from_dict({'Stock Symbol': ['TEA', 'POP', 'ALE', 'GIN', 'JOE'],
-                                   'Stock Type': ['Common', 'Common', 'Common', 'Preferred', 'Common'],
-                                   'Last Dividend': [0, 8, 23, 8, 13],
-                                   'Fixed Dividend': [None, None, None, 0.02, None],
-                                   'Par Value': [100, 100, 60, 100, 250]},
-                                  ).values.tolist()
+    return [list(row) for row in zip(['TEA', 'POP', 'ALE', 'GIN', 'JOE'],
+                                     ['Common', 'Common', 'Common', 'Preferred', 'Common'],
+                                     [0, 8, 23, 8, 13],
+                                     [None, None, None, 0.02, None],
+                                     [100, 100, 60, 100, 250])]
 
 
 @pytest.fixture(scope='module')
@@ -112,36 +110,30 @@ class TestStock:
 
 @pytest.fixture(scope='module')
 def trade_data():
-    return pd.DataFrame.from_dict({'Symbol': ['TEA', 'POP', 'ALE', 'GIN', 'JOE', 'TEA', 'POP', 'ALE', 'POP', 'ALE'],
-                                   'Timestamp': [(datetime.now() - timedelta(minutes=i)) for i in range(10)],
-                                   'Quantity': [10, 20, 20, 30, 30, 40, 50, 20, 40, 50],
-                                   'Buy_or_Sell': ['Buy', 'Sell', 'Buy', 'Buy', 'Buy', 'Buy', 'Buy', 'Buy', 'Sell',
-                                                   'Sell'],
-                                   'Price': [100, 100, 90, 100, 100, 110, 120, 90, 100, 100], },
-                                  ).values.tolist()
+    return [list(row) for row in zip(['TEA', 'POP', 'ALE', 'GIN', 'JOE', 'TEA', 'POP', 'ALE', 'POP', 'ALE'],
+                                     [(datetime.now() - timedelta(minutes=i)) for i in range(10)],
+                                     [10, 20, 20, 30, 30, 40, 50, 20, 40, 50],
+                                     ['Buy', 'Sell', 'Buy', 'Buy', 'Buy', 'Buy', 'Buy', 'Buy', 'Sell', 'Sell'],
+                                     [100, 100, 90, 100, 100, 110, 120, 90, 100, 100])]
 
 
 @pytest.fixture(scope='module')
 def trade_data_last_5():
-    return pd.DataFrame.from_dict({'Symbol': ['ALE'] * 10,
-                                   'Timestamp': [(datetime.now() - timedelta(minutes=i)) for i in range(10)],
-                                   'Quantity': [10] * 10,
-                                   'Buy_or_Sell': ['Buy'] * 10,
-                                   'Price': [100] * 10, },
-                                  ).values.tolist()
+    return [list(row) for row in zip(['ALE'] * 10,
+                                     [(datetime.now() - timedelta(minutes=i)) for i in range(10)],
+                                     [10] * 10,
+                                     ['Buy'] * 10,
+                                     [100] * 10)]
 
 
 class TestTrade:
     def test_init(self, trade_data, stocks):
         """Test creating Trade objects"""
-        stocks_data = [stock for stock in stocks[2]]
+        stocks_by_sym = {stock.symbol: stock for stock in stocks[2]}
 
-        def get_stock(symbol):
-            return [stock for stock in stocks_data if stock.symbol == symbol][0]
-
-        expected_trade = Trade(stock=get_stock('POP'), timestamp=(datetime.now() + timedelta(minutes=1)), quantity=20,
-                               buy_or_sell='Sell', price=100)
-        trades = [Trade(stock=get_stock(trade[0]), timestamp=trade[1], quantity=trade[2], buy_or_sell=trade[3],
+        expected_trade = Trade(stock=stocks_by_sym['POP'], timestamp=(datetime.now() + timedelta(minutes=1)),
+                               quantity=20, buy_or_sell='Sell', price=100)
+        trades = [Trade(stock=stocks_by_sym[trade[0]], timestamp=trade[1], quantity=trade[2], buy_or_sell=trade[3],
                         price=trade[4])
                   for trade in trade_data]
         assert len(trades) == len(trade_data)
@@ -154,12 +146,9 @@ class TestTrade:
 
 class TestStockMarket:
     def test_init(self, trade_data, stocks):
-        stocks_data = [stock for stock in stocks[3]]
-
-        def get_stock(symbol):
-            return [stock for stock in stocks_data if stock.symbol == symbol][0]
+        stocks_by_sym = {stock.symbol: stock for stock in stocks[3]}
 
-        trades = [Trade(stock=get_stock(trade[0]), timestamp=trade[1], quantity=trade[2], buy_or_sell=trade[3],
+        trades = [Trade(stock=stocks_by_sym[trade[0]], timestamp=trade[1], quantity=trade[2], buy_or_sell=trade[3],
                         price=trade[4])
                   for trade in trade_data]
         assert len(trades) == len(trade_data)
@@ -167,39 +156,68 @@ class TestStockMarket:
     def test_book_trade(self, trade_data, stocks):
         """ Test booking trades """
 
-        stocks_data = [stock for stock in stocks[4]]
-
-        def get_stock(symbol):
-            return [stock for stock in stocks_data if stock.symbol == symbol][0]
+        stocks_by_sym = {stock.symbol: stock for stock in stocks[4]}
 
         with pytest.raises(ValueError):
-            StockMarket.book_trade(stock=get_stock('GIN'), quantity=0, buy_or_sell='Sell', price=0)
+            StockMarket.book_trade(stock=stocks_by_sym['GIN'], quantity=0, buy_or_sell='Sell', price=0)
 
         trade_records = [
             (trade[1],
-             StockMarket.book_trade(stock=get_stock(trade[0]), quantity=trade[2], buy_or_sell=trade[3], price=trade[4]))
+             StockMarket.book_trade(stock=stocks_by_sym[trade[0]], quantity=trade[2], buy_or_sell=trade[3],
+                                    price=trade[4]))
             for trade in trade_data]
         stock_market = StockMarket()
         assert len(trade_records) == len(stock_market._trades)
 
-    @mock.patch.object(StockMarket, "_StockMarket__trades", new_callable=mock.PropertyMock)
-    def test_calculate_VWSP(self, trades_mock: mock.PropertyMock, trade_data_last_5, stocks):
-        """ Test calculation of VWSP for trades booked in last 5 minutes """
+    def test_book_trades(self, trade_data):
+        """ Test booking a batch of trades in one call """
 
-        with pytest.raises(ValueError):
-            StockMarket.calculate_VWSP('ALE', minutes=5)
+        with mock.patch.dict(StockMarket._markets, {StockMarket: _TradeBook()}):
+            with pytest.raises(ValueError):
+                StockMarket.book_trades(symbols=['GIN'], quantities=[0], prices=[100])
+
+            StockMarket.book_trades(symbols=[trade[0] for trade in trade_data],
+                                    quantities=[trade[2] for trade in trade_data],
+                                    prices=[trade[4] for trade in trade_data])
+            assert len(StockMarket()._trades) == len(trade_data)
+            vwsp = StockMarket.calculate_VWSP('ALE', minutes=5)
+        price_qty = 20 * 90 + 20 * 90 + 50 * 100
+        sum_qty = 20 + 20 + 50
+        assert vwsp == round((price_qty / sum_qty), 4)
 
-        stocks_data = [stock for stock in stocks[5]]
+    def test_book_trades_out_of_order(self):
+        """ Test that bulk bookings with backdated or unsorted timestamps are rejected """
 
-        def get_stock(symbol):
-            return [stock for stock in stocks_data if stock.symbol == symbol][0]
+        with mock.patch.dict(StockMarket._markets, {StockMarket: _TradeBook()}):
+            StockMarket.book_trades(symbols=['ALE'], quantities=[10], prices=[100])
 
-        trade_records = [
-            (trade[1], Trade(stock=get_stock(trade[0]), timestamp=trade[1], quantity=trade[2], buy_or_sell=trade[3],
-                             price=trade[4]))
-            for trade in trade_data_last_5]
-        trades_mock.return_value = trade_records
-        vwsp = StockMarket.calculate_VWSP('ALE', minutes=5)
+            with pytest.raises(ValueError):
+                StockMarket.book_trades(symbols=['ALE'], quantities=[10], prices=[100],
+                                        timestamps=[datetime.now() - timedelta(minutes=10)])
+            with pytest.raises(ValueError):
+                StockMarket.book_trades(symbols=['GIN', 'GIN'], quantities=[10, 10], prices=[100, 100],
+                                        timestamps=[datetime.now(), datetime.now() - timedelta(minutes=1)])
+            with pytest.raises(ValueError):
+                StockMarket.book_trades(symbols=['POP'], quantities=[10], prices=[100],
+                                        timestamps=['not a timestamp'])
+
+            book = StockMarket()._trades
+            assert len(book) == 1
+            assert book.symbols == ['ALE']
+
+    def test_calculate_VWSP(self, trade_data_last_5):
+        """ Test calculation of VWSP for trades booked in last 5 minutes """
+
+        with mock.patch.dict(StockMarket._markets, {StockMarket: _TradeBook()}):
+            with pytest.raises(ValueError):
+                StockMarket.calculate_VWSP('ALE', minutes=5)
+
+        book = _TradeBook()
+        for trade in sorted(trade_data_last_5, key=lambda trade: trade[1]):
+            book.append(_to_ns(trade[1]), book.code_for(trade[0]), trade[4], trade[2])
+
+        with mock.patch.dict(StockMarket._markets, {StockMarket: book}):
+            vwsp = StockMarket.calculate_VWSP('ALE', minutes=5)
         price_qty = (100 * 10) * 5
         sum_qty = 10 * 5
         assert vwsp == round((price_qty / sum_qty), 4)
@@ -209,17 +227,14 @@ class TestGlobalBeverageCorporationExchange:
     def test_all_stock_index(self, trade_data, stocks):
         """ Test the geometric mean of the Volume Weighted Stock Price for all stocks"""
 
-        stocks_data = [stock for stock in stocks[6]]
-
-        def get_stock(symbol):
-            return [stock for stock in stocks_data if stock.symbol == symbol][0]
+        stocks_by_sym = {stock.symbol: stock for stock in stocks[6]}
 
         for trade in trade_data:
-            GlobalBeverageCorporationExchange.book_trade(stock=get_stock(trade[0]), quantity=trade[2],
+            GlobalBeverageCorporationExchange.book_trade(stock=stocks_by_sym[trade[0]], quantity=trade[2],
                                                          buy_or_sell=trade[3], price=trade[4])
         gbc_exchange = GlobalBeverageCorporationExchange()
         all_stocks = gbc_exchange.all_stock_index()
-        assert all_stocks == float(102.8249)
+        assert all_stocks == float(102.3985)
 
     def test_all_stock_index_raise_error(self):
         """ Test ValueError for no trades"""
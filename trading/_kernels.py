@@ -0,0 +1,36 @@
+""" Numeric kernels for the trade book, JIT-compiled when numba is available. """
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # pragma: no cover - numba is an optional speed-up
+    njit = None
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def geo_mean_vwsp(sym, price, qty, n_codes):
+        """ Geometric mean of per-symbol Volume Weighted Stock Prices, in one fused pass. """
+        price_qty = np.zeros(n_codes, dtype=np.float64)
+        sum_qty = np.zeros(n_codes, dtype=np.float64)
+        for i in range(sym.shape[0]):
+            code = sym[i]
+            price_qty[code] += price[i] * qty[i]
+            sum_qty[code] += qty[i]
+        log_sum = 0.0
+        count = 0
+        for code in range(n_codes):
+            if sum_qty[code] > 0.0:
+                log_sum += np.log(price_qty[code] / sum_qty[code])
+                count += 1
+        return np.exp(log_sum / count)
+
+    # Warm-start so the JIT compilation cost is paid once at import, not on the first query.
+    geo_mean_vwsp(np.zeros(1, dtype=np.int16), np.ones(1, dtype=np.float32), np.ones(1, dtype=np.int32), 1)
+else:
+    def geo_mean_vwsp(sym, price, qty, n_codes):
+        """ NumPy fallback for the fused groupby kernel when numba is not installed. """
+        price_qty = np.bincount(sym, weights=price.astype(np.float64) * qty, minlength=n_codes)
+        sum_qty = np.bincount(sym, weights=qty, minlength=n_codes)
+        vwsp = price_qty[sum_qty > 0] / sum_qty[sum_qty > 0]
+        return float(np.exp(np.log(vwsp).mean()))
@@ -1,31 +1,56 @@
+import itertools
+import math
+import sys
+import time
 from datetime import datetime, timedelta
-from typing import List, Tuple, Union
+from functools import lru_cache
+from typing import Dict, List, Union
 
 import numpy as np
 
+from trading._kernels import geo_mean_vwsp
+
+
+def _to_ns(timestamp: datetime) -> int:
+    """ Convert a datetime to integer nanoseconds since the epoch. """
+    return int(np.datetime64(timestamp, 'ns').view(np.int64))
+
+
+def _round4(value: float) -> float:
+    """ Quantize to 4 decimals by integer scaling, cheaper than round(value, 4). """
+    return math.floor(value * 10000 + 0.5) / 10000.0
+
 
 class Stock:
     """ Stock class used for calculating dividend yield and P/E ratio"""
+    __slots__ = ('symbol', 'par_value', 'type', 'last_dividend', 'fixed_dividend', '_dividend')
+
+    def __new__(cls, symbol: str, par_value: int, stock_type: str, last_dividend: int = 0,
+                fixed_dividend: Union[float, None] = 0.0):
+        if cls is Stock:
+            cls = PreferredStock if stock_type == 'Preferred' else CommonStock
+        return object.__new__(cls)
 
     def __init__(self, symbol: str, par_value: int, stock_type: str, last_dividend: int = 0,
                  fixed_dividend: Union[float, None] = 0.0) -> None:
-        self.symbol = symbol
+        self.symbol = sys.intern(symbol)
         self.par_value = par_value
         self.type = stock_type
         self.last_dividend = last_dividend
         self.fixed_dividend = fixed_dividend
+        self._dividend = self._yield_numerator()
+
+    def _yield_numerator(self) -> Union[float, None]:
+        """ Dividend numerator, resolved once by the concrete stock class. """
+        return self.last_dividend
 
     def get_dividend_yield(self, price: int) -> float:
         """ Calculate the dividend yield, given any price as input. """
         if price <= 0:
             raise ValueError("Price must be greater than 0")
 
-        if self.type == 'Preferred':
-            if self.fixed_dividend is not None:
-                return 0.0 if self.fixed_dividend <= 0.0 else round(((self.fixed_dividend * self.par_value) / price), 4)
-        else:
-            if self.last_dividend is not None:
-                return 0.0 if self.last_dividend <= 0.0 else round((self.last_dividend / price), 4)
+        if self._dividend is not None:
+            return 0.0 if self._dividend <= 0.0 else _round4(self._dividend / price)
 
     def get_pe_ratio(self, price: int) -> float:
         """ Calculate the P/E Ratio, given any price as input. """
@@ -37,11 +62,25 @@ class Stock:
             return 0.0
 
         pe_ratio = (price / self.last_dividend)
-        return round(pe_ratio, 4)
+        return _round4(pe_ratio)
+
+
+class CommonStock(Stock):
+    """ Common stock: the dividend yield numerator is the last dividend. """
+    __slots__ = ()
+
+
+class PreferredStock(Stock):
+    """ Preferred stock: the dividend yield numerator is the fixed dividend times par value. """
+    __slots__ = ()
+
+    def _yield_numerator(self) -> Union[float, None]:
+        return None if self.fixed_dividend is None else self.fixed_dividend * self.par_value
 
 
 class Trade:
     """ Trade class used to store trade records """
+    __slots__ = ('stock', 'timestamp', 'quantity', 'buy_or_sell', 'price')
 
     def __init__(self, stock: Stock, timestamp: datetime, quantity: int, buy_or_sell: str, price: int) -> None:
         self.stock: Stock = stock
@@ -51,18 +90,135 @@ class Trade:
         self.price = price
 
 
+def _grow_columns(store, columns, capacity: int) -> None:
+    """ Reallocate the named array columns of a store to the given capacity. """
+    for column in columns:
+        old = getattr(store, column)
+        new = np.empty(capacity, dtype=old.dtype)
+        new[:store.size] = old[:store.size]
+        setattr(store, column, new)
+
+
+class _SymbolIndex:
+    """ Per-symbol timestamp-sorted index with cumulative sums for windowed queries. """
+
+    def __init__(self, capacity: int = 256) -> None:
+        self.ts = np.empty(capacity, dtype=np.int64)
+        self.pq_cum = np.empty(capacity, dtype=np.float64)
+        self.q_cum = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def append(self, ts_ns: int, price: int, quantity: int) -> None:
+        if self.size == self.ts.shape[0]:
+            _grow_columns(self, ('ts', 'pq_cum', 'q_cum'), 2 * self.size)
+        index = self.size
+        self.ts[index] = ts_ns
+        self.pq_cum[index] = (self.pq_cum[index - 1] if index else 0.0) + price * quantity
+        self.q_cum[index] = (self.q_cum[index - 1] if index else 0) + quantity
+        self.size = index + 1
+
+    def append_bulk(self, ts_ns: np.ndarray, prices: np.ndarray, quantities: np.ndarray) -> None:
+        """ Append a batch of trades, extending the cumulative sums in one vectorized step. """
+        count = ts_ns.shape[0]
+        if self.size + count > self.ts.shape[0]:
+            _grow_columns(self, ('ts', 'pq_cum', 'q_cum'), max(2 * self.ts.shape[0], self.size + count))
+        end = self.size + count
+        self.ts[self.size:end] = ts_ns
+        self.pq_cum[self.size:end] = (self.pq_cum[self.size - 1] if self.size else 0.0) + \
+            np.cumsum(prices * quantities)
+        self.q_cum[self.size:end] = (self.q_cum[self.size - 1] if self.size else 0) + np.cumsum(quantities)
+        self.size = end
+
+    def window(self, cutoff_ns: int) -> tuple:
+        """ Return (sum of price*qty, sum of qty) for trades at or after cutoff_ns. """
+        lo = int(np.searchsorted(self.ts[:self.size], cutoff_ns, side='left'))
+        price_qty = self.pq_cum[self.size - 1]
+        sum_qty = self.q_cum[self.size - 1]
+        if lo > 0:
+            price_qty -= self.pq_cum[lo - 1]
+            sum_qty -= self.q_cum[lo - 1]
+        return float(price_qty), int(sum_qty)
+
+
+class _TradeBook:
+    """ Structure-of-Arrays trade store: one contiguous column per trade field. """
+    _uids = itertools.count()
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.uid = next(self._uids)
+        self.ts = np.empty(capacity, dtype=np.int64)
+        self.sym = np.empty(capacity, dtype=np.int16)
+        # Narrow column dtypes halve the bytes moved per scan; reductions upcast to float64.
+        self.price = np.empty(capacity, dtype=np.float32)
+        self.qty = np.empty(capacity, dtype=np.int32)
+        self.size = 0
+        self.codes: Dict[str, int] = {}
+        self.symbols: List[str] = []
+        self.index: List[_SymbolIndex] = []
+
+    def __len__(self) -> int:
+        return self.size
+
+    def code_for(self, symbol: str) -> int:
+        """ Return the integer code for a symbol, registering it on first sight. """
+        code = self.codes.get(symbol)
+        if code is None:
+            symbol = sys.intern(symbol)
+            code = len(self.symbols)
+            self.codes[symbol] = code
+            self.symbols.append(symbol)
+            self.index.append(_SymbolIndex())
+        return code
+
+    def append(self, ts_ns: int, code: int, price: int, quantity: int) -> None:
+        """ Append one trade, doubling the column buffers when full. """
+        if self.size == self.ts.shape[0]:
+            _grow_columns(self, ('ts', 'sym', 'price', 'qty'), 2 * self.size)
+        index = self.size
+        self.ts[index] = ts_ns
+        self.sym[index] = code
+        self.price[index] = price
+        self.qty[index] = quantity
+        self.size = index + 1
+        self.index[code].append(ts_ns, price, quantity)
+
+    def append_bulk(self, ts_ns: np.ndarray, codes: np.ndarray, prices: np.ndarray,
+                    quantities: np.ndarray) -> None:
+        """ Append a batch of trades with one slice copy per column. """
+        count = ts_ns.shape[0]
+        if self.size + count > self.ts.shape[0]:
+            _grow_columns(self, ('ts', 'sym', 'price', 'qty'), max(2 * self.ts.shape[0], self.size + count))
+        end = self.size + count
+        self.ts[self.size:end] = ts_ns
+        self.sym[self.size:end] = codes
+        self.price[self.size:end] = prices
+        self.qty[self.size:end] = quantities
+        self.size = end
+        for code in np.unique(codes):
+            rows = codes == code
+            self.index[code].append_bulk(ts_ns[rows], prices[rows], quantities[rows])
+
+
 class StockMarket:
     """ StockMarket class used to book trades and calculate Volume Weighted Stock Price """
-    __trades: List[Tuple[datetime, Trade]] = []
+    _markets: Dict[type, _TradeBook] = {}
 
     def __init__(self):
         super().__init__()
 
     def __new__(cls, *args, **kwargs):
         instance = super().__new__(cls)
-        instance._trades = cls.__trades
+        instance._trades = cls._book()
         return instance
 
+    @classmethod
+    def _book(cls) -> '_TradeBook':
+        """ Return this market's trade book, creating it on first use. """
+        book = cls._markets.get(cls)
+        if book is None:
+            book = cls._markets[cls] = _TradeBook()
+        return book
+
     @classmethod
     def book_trade(cls, stock: Stock, buy_or_sell: str, quantity: int = 0, price: int = 0) -> None:
         """ Record a trade, with timestamp, quantity, buy or sell indicator and price. """
@@ -70,28 +226,74 @@ class StockMarket:
         if quantity < 1 or price < 1:
             raise ValueError("Price and Quantity must be greater than 0")
 
-        timestamp = datetime.now()
-        trade = Trade(stock, timestamp, quantity, buy_or_sell, price)
-        record = (trade.timestamp, trade)
-        cls.__trades.append(record)
+        book = cls._book()
+        book.append(_to_ns(datetime.now()), book.code_for(stock.symbol), price, quantity)
+
+    @classmethod
+    def book_trades(cls, symbols, quantities, prices, timestamps=None) -> None:
+        """ Record a batch of trades at once from parallel sequences of symbol, quantity and price.
+
+        Timestamps default to now for the whole batch. Explicit timestamps must be non-decreasing
+        per symbol and no older than that symbol's last booked trade, keeping the per-symbol
+        indexes sorted for the windowed VWSP lookup; a batch that fails any check books nothing.
+        """
+
+        quantities = np.asarray(quantities, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        if len(symbols) != quantities.shape[0] or len(symbols) != prices.shape[0]:
+            raise ValueError("symbols, quantities and prices must have the same length")
+        if (quantities < 1).any() or (prices < 1).any():
+            raise ValueError("Price and Quantity must be greater than 0")
+
+        book = cls._book()
+        if timestamps is None:
+            ts_ns = np.full(len(symbols), _to_ns(datetime.now()), dtype=np.int64)
+        else:
+            ts_ns = np.fromiter((_to_ns(timestamp) for timestamp in timestamps), dtype=np.int64,
+                                count=len(symbols))
+        last_seen: Dict[str, int] = {}
+        for position, symbol in enumerate(symbols):
+            last = last_seen.get(symbol)
+            if last is None:
+                code = book.codes.get(symbol)
+                if code is not None and book.index[code].size > 0:
+                    last = int(book.index[code].ts[book.index[code].size - 1])
+            if last is not None and ts_ns[position] < last:
+                raise ValueError("Timestamps must be non-decreasing for each symbol")
+            last_seen[symbol] = int(ts_ns[position])
+
+        codes = np.fromiter((book.code_for(symbol) for symbol in symbols), dtype=np.int16, count=len(symbols))
+        book.append_bulk(ts_ns, codes, prices, quantities)
 
     @classmethod
     def calculate_VWSP(cls, symbol: str, minutes: int = 5) -> float:
         """ Calculate Volume Weighted Stock Price based on trades in past 5 minutes. """
 
-        if len(cls.__trades) == 0:
+        book = cls._book()
+        if len(book) == 0:
             raise ValueError("No trades booked for this market")
 
-        if minutes > 0:
-            timestamp = datetime.now() - timedelta(minutes=minutes)
-            trades = [trade[1] for trade in reversed(cls.__trades) if
-                      trade[0] >= timestamp and trade[1].stock.symbol == symbol]
+        # Windowed results drift as trades age out, so their cache entries expire in 5-second buckets.
+        bucket = int(time.time() // 5) if minutes > 0 else 0
+        return cls._vwsp_cached(symbol, minutes, book.uid, len(book), bucket)
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def _vwsp_cached(cls, symbol: str, minutes: int, uid: int, version: int, bucket: int) -> float:
+        """ VWSP computation memoized by book identity, book length and time bucket. """
+
+        book = cls._book()
+        code = book.codes.get(symbol, -1)
+        if code < 0 or book.index[code].size == 0:
+            price_qty, sum_qty = 0.0, 0
+        elif minutes > 0:
+            cutoff = _to_ns(datetime.now() - timedelta(minutes=minutes))
+            price_qty, sum_qty = book.index[code].window(cutoff)
         else:
-            trades = [trade[1] for trade in cls.__trades if trade[1].stock.symbol == symbol]
+            idx = book.index[code]
+            price_qty, sum_qty = float(idx.pq_cum[idx.size - 1]), int(idx.q_cum[idx.size - 1])
 
-        price_qty = sum([trade.price * trade.quantity for trade in trades])
-        sum_qty = sum([trade.quantity for trade in trades])
-        return round((price_qty / sum_qty), 4)
+        return _round4(price_qty / sum_qty)
 
 
 class GlobalBeverageCorporationExchange(StockMarket):
@@ -103,12 +305,10 @@ class GlobalBeverageCorporationExchange(StockMarket):
     def all_stock_index(self) -> float:
         """ All Share Index using the geometric mean of the Volume Weighted Stock Price for all stocks """
 
-        if len(self._trades) == 0:
+        book = self._trades
+        if len(book) == 0:
             raise ValueError("No trades booked for this market")
 
-        # super._trades returns always all uptodate trades before the call,
-        # even booked by StockMarket after creating the exchange object
-        prices = [self.calculate_VWSP(trade[1].stock.symbol, 0) for trade in
-                  super().__new__(StockMarket)._trades]
-        prod = np.prod(np.array(prices), axis=0)
-        return float(round(prod ** (1 / len(prices)), 4))
+        index = geo_mean_vwsp(book.sym[:book.size], book.price[:book.size], book.qty[:book.size],
+                              len(book.symbols))
+        return _round4(float(index))